@@ -1,5 +1,25 @@
+import logging
+import math
+import statistics
+import time
+from config import ALERT_CHECK_INTERVAL, ALERT_DAILY_BUDGET
+from stock_api import get_cached_closes, get_remaining_daily_requests
+
+logger = logging.getLogger(__name__)
+
 ALERTS = {}  # Format: {chat_id: {symbol: (threshold, interval)}}
 
+# Adaptive polling
+PLAN_HORIZON = 86400       # Budget window in seconds (matches the daily API limit)
+VOLATILITY_WINDOW = 20     # Number of daily returns used to estimate volatility
+DEFAULT_VOLATILITY = 0.02  # Daily log-return stdev assumed when no history is cached
+MIN_PROBABILITY = 1e-4     # Keeps far-away alerts on a slow but non-zero cadence
+MAX_POLL_INTERVAL = 7 * 86400  # Slowest cadence for an alert, however far from its threshold
+POLL_PLAN = {}             # Format: {symbol: interval}
+LAST_POLLED = {}           # Format: {symbol: timestamp of last poll attempt, successful or not}
+POLL_SLACK = 1             # Seconds of job queue jitter tolerated when deciding a symbol is due
+PLANNER_METRICS = {}       # Last plan summary, including expected detection delay
+
 def add_alert(chat_id, symbol, threshold, interval=60):
     if chat_id not in ALERTS:
         ALERTS[chat_id] = {}
@@ -12,4 +32,137 @@ def remove_alert(chat_id, symbol):
     if chat_id in ALERTS and symbol in ALERTS[chat_id]:
         del ALERTS[chat_id][symbol]
     if chat_id in ALERTS and not ALERTS[chat_id]:
-        del ALERTS[chat_id]
\ No newline at end of file
+        del ALERTS[chat_id]
+
+def estimate_volatility(closes):
+    """Daily log-return standard deviation over the recent window"""
+    closes = [c for c in closes[-(VOLATILITY_WINDOW + 1):] if c > 0]
+    returns = [math.log(b / a) for a, b in zip(closes, closes[1:])]
+    if len(returns) < 2:
+        return DEFAULT_VOLATILITY
+    return statistics.stdev(returns) or DEFAULT_VOLATILITY
+
+def crossing_probability(price, threshold, volatility, horizon_days):
+    """Chance that price touches threshold within the horizon (random walk, reflection principle)"""
+    if price is None or price <= 0:
+        return 0.0  # Nothing stored (unknown symbol or failed fetches): slowest cadence
+    if price >= threshold:
+        return 1.0
+    spread = volatility * math.sqrt(horizon_days)
+    if spread <= 0:
+        return 0.0
+    distance = math.log(threshold / price)
+    return math.erfc(distance / (spread * math.sqrt(2)))
+
+def plan_alert_polling(paused_chats=()):
+    """Split the alert request budget across symbols by their chance of crossing a threshold.
+
+    Polling every T seconds delays detection by T/2 on average, so minimising the
+    probability-weighted delay under a fixed request count gives each symbol a
+    share of requests proportional to sqrt(p). Alerts of paused chats get no share.
+    Reads stored history, so call it off the event loop.
+    """
+    symbols = {}  # Format: {symbol: (thresholds, min_interval)}
+    for chat_id, alerts in list(ALERTS.items()):
+        if chat_id in paused_chats:
+            continue
+        for symbol, (threshold, interval) in alerts.items():
+            thresholds, min_interval = symbols.get(symbol, ([], interval))
+            thresholds.append(threshold)
+            symbols[symbol] = (thresholds, min(min_interval, interval))
+
+    budget = min(ALERT_DAILY_BUDGET, get_remaining_daily_requests())
+    horizon_days = PLAN_HORIZON / 86400
+    probabilities = {}
+    for symbol, (thresholds, _) in symbols.items():
+        closes = get_cached_closes(symbol, VOLATILITY_WINDOW + 1)
+        price = float(closes[-1]) if len(closes) else None
+        volatility = estimate_volatility(closes)
+        probabilities[symbol] = max(
+            crossing_probability(price, threshold, volatility, horizon_days) for threshold in thresholds
+        )
+
+    # Water-fill: symbols pinned to their interval bounds take a fixed share, the rest is re-split
+    weights = {symbol: math.sqrt(max(p, MIN_PROBABILITY)) for symbol, p in probabilities.items()}
+    plan = {}
+    remaining_budget = budget
+    while weights:
+        total_weight = sum(weights.values())
+        pinned = {}
+        for symbol, weight in weights.items():
+            requests = remaining_budget * weight / total_weight
+            interval = PLAN_HORIZON / requests if requests > 0 else MAX_POLL_INTERVAL
+            lower = max(symbols[symbol][1], ALERT_CHECK_INTERVAL)
+            if interval < lower or interval > MAX_POLL_INTERVAL:
+                pinned[symbol] = min(max(interval, lower), MAX_POLL_INTERVAL)
+            else:
+                plan[symbol] = interval
+        if not pinned:
+            break
+        for symbol, interval in pinned.items():
+            plan[symbol] = interval
+            remaining_budget = max(remaining_budget - PLAN_HORIZON / interval, 0)
+            del weights[symbol]
+    planned_requests = sum(PLAN_HORIZON / interval for interval in plan.values())
+
+    total_probability = sum(probabilities.values())
+    expected_delay = (
+        sum(p * plan[symbol] / 2 for symbol, p in probabilities.items()) / total_probability
+        if total_probability > 0 else 0.0
+    )
+    # Only a change in what is planned is worth an INFO line; the 60 s re-plans go to DEBUG
+    changed = set(plan) != set(POLL_PLAN) or budget != PLANNER_METRICS.get("budget")
+    POLL_PLAN.clear()
+    POLL_PLAN.update(plan)
+    PLANNER_METRICS.update({
+        "updated": time.time(),
+        "symbols": len(plan),
+        "budget": budget,
+        "planned_requests": planned_requests,
+        "expected_detection_delay": expected_delay,
+    })
+    if plan:
+        logger.log(
+            logging.INFO if changed else logging.DEBUG,
+            "Alert polling plan: %s symbols, %.1f/%s requests per day, expected detection delay %.0fs",
+            len(plan), planned_requests, budget, expected_delay
+        )
+    return dict(plan)
+
+def format_planner_metrics():
+    """Human-readable summary of the last plan, for the admin /alertplan command"""
+    if not PLANNER_METRICS:
+        return "No alert polling plan yet."
+    lines = [
+        f"Alert polling plan ({time.time() - PLANNER_METRICS['updated']:.0f}s ago)",
+        f"Symbols: {PLANNER_METRICS['symbols']}",
+        f"Requests per day: {PLANNER_METRICS['planned_requests']:.1f} of {PLANNER_METRICS['budget']}",
+        f"Expected detection delay: {PLANNER_METRICS['expected_detection_delay']:.0f}s",
+    ]
+    lines += [f"{symbol}: every {interval:.0f}s" for symbol, interval in sorted(POLL_PLAN.items())]
+    return "\n".join(lines)
+
+def get_poll_interval(symbol):
+    return POLL_PLAN.get(symbol, ALERT_CHECK_INTERVAL)
+
+def take_due_symbols(paused_chats=(), now=None):
+    """Symbols whose planned interval has passed since their last poll attempt, marked as polled.
+
+    The attempt is recorded whatever the fetch returns, so failing symbols stay on
+    their planned cadence instead of being retried on every check.
+    """
+    now = time.time() if now is None else now
+    active = set()
+    for chat_id, alerts in ALERTS.items():
+        if chat_id not in paused_chats:
+            active.update(alerts)
+    for symbol in list(LAST_POLLED):
+        if symbol not in active:
+            del LAST_POLLED[symbol]
+    due = [
+        symbol for symbol in active
+        if symbol not in LAST_POLLED or now - LAST_POLLED[symbol] >= get_poll_interval(symbol) - POLL_SLACK
+    ]
+    for symbol in due:
+        LAST_POLLED[symbol] = now
+    return due
@@ -0,0 +1,65 @@
+"""Time per chart: the previous pyplot path against the reused figure templates.
+
+Run from the repository root: python benchmarks/bench_chart_render.py
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("UPSTREAM_KEYS", "static:bench")  # Renders only; no data is fetched
+from plotter import get_template
+
+logging.getLogger("matplotlib").setLevel(logging.WARNING)
+
+ROUNDS = 30
+
+def pyplot_chart(symbol, dates, closes, path):
+    """generate_chart's plotting before templates were introduced"""
+    plt.figure(figsize=(10, 5))
+    plt.plot(dates, closes, marker='o', linestyle='-', color='blue', label=f"{symbol} Price")
+    plt.title(f"{symbol} Price Chart (Last 30 Days)")
+    plt.xlabel("Date")
+    plt.ylabel("Price (USD)")
+    plt.xticks(rotation=45)
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+def make_series(seed):
+    rng = np.random.default_rng(seed)
+    dates = np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-01-31"))
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+    return dates, closes
+
+def bench(name, render, out_dir):
+    # One warm-up call so template construction and font caches are not counted
+    render("WARM", *make_series(0), os.path.join(out_dir, "warm.png"))
+    timings = []
+    for i in range(ROUNDS):
+        dates, closes = make_series(i)
+        path = os.path.join(out_dir, f"{name}_{i}.png")
+        start = time.perf_counter()
+        render(f"SYM{i}", dates, closes, path)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{name:<10} median {timings[len(timings) // 2] * 1000:7.1f} ms, min {timings[0] * 1000:7.1f} ms")
+    return timings[len(timings) // 2]
+
+def main():
+    with tempfile.TemporaryDirectory() as out_dir:
+        baseline = bench("pyplot", pyplot_chart, out_dir)
+        template = bench("template", get_template("price").render, out_dir)
+        sparkline = bench("sparkline", get_template("sparkline").render, out_dir)
+    print(f"template speedup {baseline / template:.1f}x, sparkline speedup {baseline / sparkline:.1f}x")
+
+if __name__ == "__main__":
+    main()
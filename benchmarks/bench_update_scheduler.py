@@ -0,0 +1,79 @@
+"""Head-of-line blocking: one slow /chart followed by quick replies from other chats.
+
+Chat 0's own follow-up still waits for its /chart, so the scheduled max stays
+near SLOW_SECONDS; every other chat should answer in milliseconds.
+
+Run from the repository root: python benchmarks/bench_update_scheduler.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from update_scheduler import ChatUpdateScheduler
+
+SLOW_SECONDS = 1.0   # Roughly a cold /chart: fetch plus render
+FAST_SECONDS = 0.01  # A cached /price reply
+CHATS = 50
+
+def make_updates():
+    """One slow update from chat 0, then a fast update from every chat (chat 0 included)"""
+    updates = [(0, SLOW_SECONDS)]
+    updates += [(chat_id, FAST_SECONDS) for chat_id in range(CHATS)]
+    return updates
+
+async def run_serial(updates):
+    latencies = {}
+    order = []
+    start = time.perf_counter()
+    for index, (chat_id, seconds) in enumerate(updates):
+        await asyncio.sleep(seconds)
+        order.append((chat_id, index))
+        latencies[index] = time.perf_counter() - start
+    return latencies, order
+
+async def run_scheduled(updates):
+    scheduler = ChatUpdateScheduler()
+    latencies = {}
+    order = []
+    start = time.perf_counter()
+
+    def make_job(index, chat_id, seconds):
+        async def job():
+            await asyncio.sleep(seconds)
+            order.append((chat_id, index))
+            latencies[index] = time.perf_counter() - start
+        return job
+
+    for index, (chat_id, seconds) in enumerate(updates):
+        await scheduler.submit(chat_id, make_job(index, chat_id, seconds))
+    await scheduler.shutdown()
+    return latencies, order
+
+def in_chat_order(order):
+    last_seen = {}
+    for chat_id, index in order:
+        if index < last_seen.get(chat_id, -1):
+            return False
+        last_seen[chat_id] = index
+    return True
+
+def report(name, latencies, order):
+    fast = [latency for index, latency in latencies.items() if index > 0]
+    fast.sort()
+    p95 = fast[int(len(fast) * 0.95) - 1]
+    print(
+        f"{name:<10} fast replies: median {statistics.median(fast) * 1000:7.1f} ms, "
+        f"p95 {p95 * 1000:7.1f} ms, max {fast[-1] * 1000:7.1f} ms, "
+        f"per-chat order kept: {in_chat_order(order)}"
+    )
+
+async def main():
+    updates = make_updates()
+    report("serial", *await run_serial(updates))
+    report("scheduled", *await run_scheduled(updates))
+
+if __name__ == "__main__":
+    asyncio.run(main())
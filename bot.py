@@ -1,4 +1,3 @@
-import tempfile
 import os
 import logging
 import asyncio
@@ -12,20 +11,21 @@ from telegram.ext import (
     filters,
     ApplicationBuilder,
 )
-from config import TELEGRAM_BOT_TOKEN, ALERT_CHECK_INTERVAL
-from stock_api import get_current_price, calculate_moving_averages
-from plotter import generate_chart
-from alerts import add_alert, get_alerts, remove_alert, ALERTS
+from config import TELEGRAM_BOT_TOKEN, ALERT_CHECK_INTERVAL, UPDATE_QUEUE_LIMIT
+from stock_api import get_current_price
+from replies import get_reply
+from plotter import generate_chart, generate_sparkline
+from update_scheduler import ScheduledApplication
+from telemetry import setup_logging, TracedHTTPXRequest
+from snapshot import save_snapshot, restore_snapshot
+from alerts import add_alert, get_alerts, remove_alert, plan_alert_polling, get_poll_interval, take_due_symbols, ALERTS
 
 # Configure matplotlib for headless environments
 import matplotlib
 matplotlib.use('Agg')  # Set non-interactive backend
 
-# Logging configuration
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
+# Logging configuration: records are formatted and written by a background thread
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Global state
@@ -34,12 +34,19 @@ PAUSED_CHATS = set()
 async def check_alerts(context: ContextTypes.DEFAULT_TYPE):
     """Check and trigger price alerts"""
     try:
+        # The planner reads stored history, so keep it off the event loop
+        await asyncio.to_thread(plan_alert_polling, set(PAUSED_CHATS))
+        # Only symbols due under the plan are fetched, once each however many chats watch them;
+        # cached data younger than the planned interval is reused without spending quota
+        prices = {}
+        for symbol in take_due_symbols(PAUSED_CHATS):
+            prices[symbol] = await asyncio.to_thread(get_current_price, symbol, max_age=get_poll_interval(symbol))
         for chat_id in list(ALERTS.keys()):
             if chat_id in PAUSED_CHATS:
                 continue
             alerts = get_alerts(chat_id)
-            for symbol, (threshold, interval) in alerts.items():
-                current_price = get_current_price(symbol)
+            for symbol, (threshold, interval) in list(alerts.items()):
+                current_price = prices.get(symbol)
                 if isinstance(current_price, str):  # Rate limit message
                     continue
                 if current_price and current_price >= threshold:
@@ -49,7 +56,7 @@ async def check_alerts(context: ContextTypes.DEFAULT_TYPE):
                     )
                     remove_alert(chat_id, symbol)
     except Exception as e:
-        logger.error(f"Error in check_alerts: {e}")
+        logger.error("Error in check_alerts: %s", e)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send welcome message with inline keyboard"""
@@ -77,7 +84,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/price <symbol> - Get current price (e.g., /price AAPL)\n"
         "/ma <symbol> - Get moving averages (e.g., /ma AAPL)\n"
         "/alert <symbol> <threshold> [interval] - Set alert (e.g., /alert AAPL 100 30)\n"
-        "/chart <symbol> - View price chart (e.g., /chart AAPL)\n\n"
+        "/chart <symbol> [spark] - View price chart (e.g., /chart AAPL, or /chart AAPL spark for a sparkline)\n\n"
         "Features (select from menu or use commands):\n"
         "- Get Price: Enter symbol (e.g., AAPL)\n"
         "- Moving Averages: Enter symbol (e.g., AAPL)\n"
@@ -109,13 +116,8 @@ async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if symbol == "USD":
         await update.message.reply_text("USD is the base currency and does not have a price. Please enter a valid stock or crypto symbol (e.g., AAPL, USDT).")
         return
-    price = get_current_price(symbol)
-    if isinstance(price, str):
-        await update.message.reply_text(price)
-    elif price:
-        await update.message.reply_text(f"Current price of {symbol}: ${price:.2f}")
-    else:
-        await update.message.reply_text("Invalid symbol or API error.")
+    reply = await asyncio.to_thread(get_reply, "price", symbol)
+    await update.message.reply_text(reply)
 
 async def ma_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
@@ -125,16 +127,8 @@ async def ma_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if symbol == "USD":
         await update.message.reply_text("USD is the base currency and cannot be used for moving averages. Please enter a valid stock or crypto symbol (e.g., AAPL, USDT).")
         return
-    ma7 = calculate_moving_averages(symbol, 7)
-    ma14 = calculate_moving_averages(symbol, 14)
-    if isinstance(ma7, str):
-        await update.message.reply_text(ma7)
-    elif ma7 is not None and ma14 is not None:
-        await update.message.reply_text(
-            f"{symbol} Moving Averages:\n7-day: ${ma7:.2f}\n14-day: ${ma14:.2f}"
-        )
-    else:
-        await update.message.reply_text("Invalid symbol or API error.")
+    reply = await asyncio.to_thread(get_reply, "ma", symbol)
+    await update.message.reply_text(reply)
 
 async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.message.chat_id
@@ -158,22 +152,21 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("Usage: /chart <symbol> (e.g., /chart AAPL)")
+        await update.message.reply_text("Usage: /chart <symbol> [spark] (e.g., /chart AAPL)")
         return
     symbol = context.args[0].upper()
     if symbol == "USD":
         await update.message.reply_text("USD is the base currency and cannot be used for charts. Please enter a valid stock or crypto symbol (e.g., AAPL, USDT).")
         return
+    render = generate_sparkline if len(context.args) > 1 and context.args[1].lower() == "spark" else generate_chart
     try:
-        chart_path = generate_chart(symbol)
-        if chart_path:
-            with open(chart_path, "rb") as photo:
-                await update.message.reply_photo(photo=photo)
-            os.remove(chart_path)
+        chart = await asyncio.to_thread(render, symbol)
+        if chart:
+            await update.message.reply_photo(photo=chart)
         else:
             await update.message.reply_text("Invalid symbol or API error.")
     except Exception as e:
-        logger.error(f"Error generating chart for {symbol}: {e}")
+        logger.error("Error generating chart for %s: %s", symbol, e)
         await update.message.reply_text("Failed to generate chart. Please try again later.")
 
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -182,7 +175,7 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     context.user_data["action"] = query.data
     context.user_data["user_id"] = user_id
-    logger.info(f"User {user_id} selected action: {query.data} in chat {query.message.chat_id}")
+    logger.debug("User %s selected action: %s in chat %s", user_id, query.data, query.message.chat_id)
     if query.data == "price":
         await query.message.reply_text("Enter stock symbol (e.g., AAPL):", reply_to_message_id=query.message.message_id)
     elif query.data == "ma":
@@ -196,43 +189,29 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     chat_id = update.message.chat_id
     text = update.message.text.strip()
-    logger.info(f"Received text '{text}' from user {user_id} in chat {chat_id}")
+    logger.debug("Received text '%s' from user %s in chat %s", text, user_id, chat_id)
 
     stored_user_id = context.user_data.get("user_id")
     if stored_user_id != user_id:
-        logger.warning(f"User mismatch: Expected {stored_user_id}, got {user_id}")
+        logger.warning("User mismatch: Expected %s, got %s", stored_user_id, user_id)
         await update.message.reply_text("Please select an option from the menu first using /start.")
         return
 
     action = context.user_data.get("action")
-    logger.info(f"Action for user {user_id}: {action}")
+    logger.debug("Action for user %s: %s", user_id, action)
 
     if action == "price":
         if text.upper() == "USD":
             await update.message.reply_text("USD is the base currency and does not have a price. Please enter a valid stock or crypto symbol (e.g., AAPL, USDT).")
         else:
-            price = get_current_price(text.upper())
-            if isinstance(price, str):
-                await update.message.reply_text(price)
-            elif price:
-                await update.message.reply_text(f"Current price of {text.upper()}: ${price:.2f}")
-            else:
-                await update.message.reply_text("Invalid symbol or API error.")
+            reply = await asyncio.to_thread(get_reply, "price", text.upper())
+            await update.message.reply_text(reply)
     elif action == "ma":
         if text.upper() == "USD":
             await update.message.reply_text("USD is the base currency and cannot be used for moving averages. Please enter a valid stock or crypto symbol (e.g., AAPL, USDT).")
         else:
-            symbol = text.upper()
-            ma7 = calculate_moving_averages(symbol, 7)
-            ma14 = calculate_moving_averages(symbol, 14)
-            if isinstance(ma7, str):
-                await update.message.reply_text(ma7)
-            elif ma7 is not None and ma14 is not None:
-                await update.message.reply_text(
-                    f"{symbol} Moving Averages:\n7-day: ${ma7:.2f}\n14-day: ${ma14:.2f}"
-                )
-            else:
-                await update.message.reply_text("Invalid symbol or API error.")
+            reply = await asyncio.to_thread(get_reply, "ma", text.upper())
+            await update.message.reply_text(reply)
     elif action == "alert":
         parts = text.split()
         if len(parts) < 2:
@@ -261,22 +240,21 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             symbol = text.upper()
             try:
-                with tempfile.NamedTemporaryFile(delete=True) as temp_file:
-                    chart_path = generate_chart(symbol)
-                    if chart_path:
-                        with open(chart_path, "rb") as photo:
-                            await update.message.reply_photo(photo=photo)
-                        os.remove(chart_path)
-                    else:
-                        await update.message.reply_text("Invalid symbol or API error.")
+                chart = await asyncio.to_thread(generate_chart, symbol)
+                if chart:
+                    await update.message.reply_photo(photo=chart)
+                else:
+                    await update.message.reply_text("Invalid symbol or API error.")
             except Exception as e:
-                logger.error(f"Error generating chart for {symbol}: {e}")
+                logger.error("Error generating chart for %s: %s", symbol, e)
                 await update.message.reply_text("Failed to generate chart. Please try again later.")
     else:
         await update.message.reply_text("Use /start for the menu or /help for commands.")
 
 async def post_init(application: Application):
-    """Initialize webhook if in production"""
+    """Restore the previous process's snapshot and initialize webhook if in production"""
+    # Runs before the first update is processed, so handlers see the restored state
+    restore_snapshot(application, PAUSED_CHATS)
     if os.environ.get("ENV") == "prod":
         webhook_url = os.getenv("WEBHOOK_URL")
         if not webhook_url:
@@ -284,16 +262,28 @@ async def post_init(application: Application):
         
         await application.bot.set_webhook(
             url=f"{webhook_url}/webhook",
-            drop_pending_updates=True
+            drop_pending_updates=False  # Updates queued during a redeploy are handled by the new process
         )
-        logger.info(f"Webhook configured for {webhook_url}")
+        logger.info("Webhook configured for %s", webhook_url)
+
+async def post_stop(application: Application):
+    """Snapshot state once updates have stopped and in-flight handlers have drained"""
+    try:
+        save_snapshot(application, PAUSED_CHATS)
+    except Exception as e:
+        logger.error("Failed to save snapshot: %s", e)
 
 async def setup_application() -> Application:
     """Configure and return the Telegram application"""
     application = (
         ApplicationBuilder()
+        .application_class(ScheduledApplication)
         .token(TELEGRAM_BOT_TOKEN)
+        # Bounded so a full scheduler backs up into the updater and Telegram, not into memory
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_LIMIT))
+        .request(TracedHTTPXRequest(connection_pool_size=256))
         .post_init(post_init)
+        .post_stop(post_stop)
         .build()
     )
     
@@ -349,7 +339,7 @@ async def main():
             await application.run_polling()
             
     except Exception as e:
-        logger.error(f"Failed to start bot: {e}")
+        logger.error("Failed to start bot: %s", e)
         raise
 
 if __name__ == "__main__":
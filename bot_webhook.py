@@ -1,5 +1,7 @@
 import tempfile
 import os
+import io
+import time
 import logging
 import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -12,21 +14,23 @@ from telegram.ext import (
     filters,
     ApplicationBuilder,
 )
-from config import TELEGRAM_BOT_TOKEN, ALERT_CHECK_INTERVAL
-from stock_api import get_current_price, calculate_moving_averages
-from plotter import generate_chart
-from alerts import add_alert, get_alerts, remove_alert, ALERTS
+from config import TELEGRAM_BOT_TOKEN, ALERT_CHECK_INTERVAL, UPDATE_QUEUE_LIMIT
+from stock_api import get_current_price
+from replies import get_reply
+from plotter import generate_chart, generate_sparkline
+from update_scheduler import ScheduledApplication
+from telemetry import setup_logging, TracedHTTPXRequest
+from snapshot import save_snapshot, restore_snapshot
+from alerts import add_alert, get_alerts, remove_alert, plan_alert_polling, get_poll_interval, take_due_symbols, format_planner_metrics, ALERTS
+from profiler import sample_cpu, trace_allocations, ProfilerBusyError, MAX_PROFILE_SECONDS
 from user_plan import get_user_plan, is_premium, is_bmc, is_free, set_user_plan
 
 # Configure matplotlib for headless environments
 import matplotlib
 matplotlib.use('Agg')  # Set non-interactive backend
 
-# Logging configuration
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
+# Logging configuration: records are formatted and written by a background thread
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Global state
@@ -36,12 +40,19 @@ ADMIN_USER_IDS = [7087347278]  # Replace with your Telegram ID
 async def check_alerts(context: ContextTypes.DEFAULT_TYPE):
     """Check and trigger price alerts"""
     try:
+        # The planner reads stored history, so keep it off the event loop
+        await asyncio.to_thread(plan_alert_polling, set(PAUSED_CHATS))
+        # Only symbols due under the plan are fetched, once each however many chats watch them;
+        # cached data younger than the planned interval is reused without spending quota
+        prices = {}
+        for symbol in take_due_symbols(PAUSED_CHATS):
+            prices[symbol] = await asyncio.to_thread(get_current_price, symbol, max_age=get_poll_interval(symbol))
         for chat_id in list(ALERTS.keys()):
             if chat_id in PAUSED_CHATS:
                 continue
             alerts = get_alerts(chat_id)
-            for symbol, (threshold, interval) in alerts.items():
-                current_price = get_current_price(symbol)
+            for symbol, (threshold, interval) in list(alerts.items()):
+                current_price = prices.get(symbol)
                 if isinstance(current_price, str):  # Rate limit message
                     continue
                 if current_price and current_price >= threshold:
@@ -51,7 +62,7 @@ async def check_alerts(context: ContextTypes.DEFAULT_TYPE):
                     )
                     remove_alert(chat_id, symbol)
     except Exception as e:
-        logger.error(f"Error in check_alerts: {e}")
+        logger.error("Error in check_alerts: %s", e)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send welcome message with inline keyboard"""
@@ -76,7 +87,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/price <symbol> - Get current price\n"
         "/ma <symbol> - Get moving averages\n"
         "/alert <symbol> <threshold> - Set alert\n"
-        "/chart <symbol> - View price chart\n"
+        "/chart <symbol> [spark] - View price chart or sparkline\n"
         "/myplan - View your current plan\n"
         "/upgrade - View upgrade options"
     )
@@ -112,13 +123,8 @@ async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: /price <symbol> (e.g., /price AAPL)")
         return
     symbol = context.args[0].upper()
-    price = get_current_price(symbol)
-    if isinstance(price, str):
-        await update.message.reply_text(price)
-    elif price:
-        await update.message.reply_text(f"Current price of {symbol}: ${price:.2f}")
-    else:
-        await update.message.reply_text("Invalid symbol or API error.")
+    reply = await asyncio.to_thread(get_reply, "price", symbol)
+    await update.message.reply_text(reply)
 
 async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.message.chat_id
@@ -150,21 +156,56 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("Usage: /chart <symbol>")
+        await update.message.reply_text("Usage: /chart <symbol> [spark]")
         return
     symbol = context.args[0].upper()
+    render = generate_sparkline if len(context.args) > 1 and context.args[1].lower() == "spark" else generate_chart
     try:
-        chart_path = generate_chart(symbol)
-        if chart_path:
-            with open(chart_path, "rb") as photo:
-                await update.message.reply_photo(photo=photo)
-            os.remove(chart_path)
+        chart = await asyncio.to_thread(render, symbol)
+        if chart:
+            await update.message.reply_photo(photo=chart)
         else:
             await update.message.reply_text("Invalid symbol or API error.")
     except Exception as e:
-        logger.error(f"Error generating chart: {e}")
+        logger.error("Error generating chart: %s", e)
         await update.message.reply_text("Failed to generate chart.")
 
+def is_admin(user_id):
+    return user_id in ADMIN_USER_IDS
+
+async def _run_profile(update: Update, context: ContextTypes.DEFAULT_TYPE, profile, name):
+    """Admin-only: run profile(seconds) in a worker thread and reply with the report as a file"""
+    if not is_admin(update.effective_user.id):
+        return  # Stay silent so the command isn't discoverable
+    try:
+        seconds = int(context.args[0]) if context.args else 10
+    except ValueError:
+        await update.message.reply_text(f"Usage: /{name} [seconds]")
+        return
+    seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+    await update.message.reply_text(f"Profiling for {seconds} seconds...")
+    try:
+        report = await asyncio.to_thread(profile, seconds)
+    except ProfilerBusyError as e:
+        await update.message.reply_text(str(e))
+        return
+    await update.message.reply_document(
+        document=io.BytesIO(report.encode()),
+        filename=f"{name}_{int(time.time())}.txt"
+    )
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _run_profile(update, context, sample_cpu, "profile")
+
+async def memprofile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _run_profile(update, context, trace_allocations, "memprofile")
+
+async def alertplan_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin-only: show the alert polling plan and its expected detection delay"""
+    if not is_admin(update.effective_user.id):
+        return
+    await update.message.reply_text(format_planner_metrics())
+
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -174,22 +215,36 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Add other button handlers as needed
 
 async def post_init(application: Application):
-    """Initialize webhook if in production"""
+    """Restore the previous process's snapshot and initialize webhook if in production"""
+    # Runs before the first update is processed, so handlers see the restored state
+    restore_snapshot(application, PAUSED_CHATS)
     if os.environ.get("ENV") == "prod":
         webhook_url = os.getenv("WEBHOOK_URL")
         if webhook_url:
             await application.bot.set_webhook(
                 url=f"{webhook_url}/webhook",
-                drop_pending_updates=True
+                drop_pending_updates=False  # Updates queued during a redeploy are handled by the new process
             )
-            logger.info(f"Webhook configured for {webhook_url}")
+            logger.info("Webhook configured for %s", webhook_url)
+
+async def post_stop(application: Application):
+    """Snapshot state once updates have stopped and in-flight handlers have drained"""
+    try:
+        save_snapshot(application, PAUSED_CHATS)
+    except Exception as e:
+        logger.error("Failed to save snapshot: %s", e)
 
 async def setup_application() -> Application:
     """Configure and return the Telegram application"""
     application = (
         ApplicationBuilder()
+        .application_class(ScheduledApplication)
         .token(TELEGRAM_BOT_TOKEN)
+        # Bounded so a full scheduler backs up into the updater and Telegram, not into memory
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_LIMIT))
+        .request(TracedHTTPXRequest(connection_pool_size=256))
         .post_init(post_init)
+        .post_stop(post_stop)
         .build()
     )
     
@@ -201,6 +256,9 @@ async def setup_application() -> Application:
     application.add_handler(CommandHandler("chart", chart_command))
     application.add_handler(CommandHandler("myplan", myplan_command))
     application.add_handler(CommandHandler("upgrade", upgrade_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("memprofile", memprofile_command))
+    application.add_handler(CommandHandler("alertplan", alertplan_command))
     application.add_handler(CallbackQueryHandler(button))
     
     # Schedule jobs
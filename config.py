@@ -4,8 +4,30 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+def _is_placeholder(value):
+    # Values copied unchanged from .env.example, e.g. "your_fmp_key"
+    return value.strip().lower().startswith("your_")
+
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
+FMP_API_KEY = os.getenv("FMP_API_KEY")
+# Comma-separated "provider:key" entries (bare keys are Alpha Vantage), e.g. "KEY1,KEY2,fmp:KEY3"
+UPSTREAM_KEYS = os.getenv("UPSTREAM_KEYS", ALPHA_VANTAGE_API_KEY or "").split(",")
+if FMP_API_KEY:
+    UPSTREAM_KEYS.append(f"fmp:{FMP_API_KEY}")
+UPSTREAM_KEYS = [
+    entry.strip() for entry in UPSTREAM_KEYS
+    if entry.strip() and not _is_placeholder(entry.rpartition(":")[2])
+]
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history")  # Memory-mapped daily bars, one file per column
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "state_snapshot.bin")  # Handoff state written on shutdown
+SNAPSHOT_MAX_AGE = 86400  # Older snapshots are ignored on startup
 CACHE_DURATION_STOCKS = 1800  # 30 minutes
 CACHE_DURATION_CRYPTO = 60    # 1 minute
 ALERT_CHECK_INTERVAL = 60     # Default alert check interval in seconds
+ALERT_DAILY_BUDGET = 15       # Share of the daily API quota spent on alert polling
+UPDATE_WORKERS = 8            # Chats processed concurrently
+UPDATE_QUEUE_LIMIT = 256      # Queued updates before intake is paused (also bounds PTB's update_queue)
+UPDATE_CHAT_QUEUE_LIMIT = 32  # Queued updates per chat before that chat's new updates are dropped
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))  # Share of updates that log a latency breakdown
 FPS = 60
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os
+import threading
+from collections import namedtuple
+import numpy as np
+from config import HISTORY_DIR
+
+# Columns are read-only memory maps, sorted oldest first
+History = namedtuple("History", ["dates", "closes"])  # datetime64[D], float64
+
+_WRITE_LOCK = threading.Lock()
+
+def _column_paths(symbol):
+    base = os.path.join(HISTORY_DIR, symbol.upper())
+    return f"{base}.dates.npy", f"{base}.close.npy"
+
+def load_history(symbol):
+    """Memory-mapped history for symbol, or None if nothing has been stored yet"""
+    dates_path, closes_path = _column_paths(symbol)
+    try:
+        dates = np.load(dates_path, mmap_mode="r")
+        closes = np.load(closes_path, mmap_mode="r")
+    except (FileNotFoundError, ValueError):
+        return None
+    if len(dates) != len(closes):
+        return None  # Interrupted write; the next refresh rebuilds it
+    return History(dates, closes)
+
+def last_stored_date(symbol):
+    history = load_history(symbol)
+    if history is None or not len(history.dates):
+        return None
+    return history.dates[-1]
+
+def _write_column(path, values):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, values)
+    os.replace(tmp_path, path)  # Readers holding the old map keep a consistent view
+
+def merge_bars(symbol, bars):
+    """Merge {"YYYY-MM-DD": close} into the stored history.
+
+    Fetched values replace stored ones on the same date; stored dates outside the
+    fetched window are kept, so a provider that lags a day can't drop the latest bar.
+    """
+    if not bars:
+        return load_history(symbol)
+    new_days = sorted(bars)
+    new_dates = np.array(new_days, dtype="datetime64[D]")
+    new_closes = np.array([bars[day] for day in new_days], dtype=np.float64)
+
+    with _WRITE_LOCK:
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+        history = load_history(symbol)
+        if history is not None and len(history.dates):
+            # Union keyed by date: np.unique keeps the first occurrence, so fetched bars go first
+            dates, first = np.unique(np.concatenate([new_dates, history.dates]), return_index=True)
+            closes = np.concatenate([new_closes, history.closes])[first]
+        else:
+            dates, closes = new_dates, new_closes
+        dates_path, closes_path = _column_paths(symbol)
+        # Closes first: a reader that sees new dates with old closes rejects the pair on length
+        _write_column(closes_path, closes)
+        _write_column(dates_path, dates)
+    return load_history(symbol)
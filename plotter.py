@@ -1,47 +1,92 @@
 import matplotlib
 matplotlib.use("Agg")  # Non-interactive backend for servers/headless use
-import matplotlib.pyplot as plt
-import os
-import pandas as pd
-import time
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.dates import DateFormatter
+from matplotlib.figure import Figure
+import numpy as np
+import io
+import threading
 from stock_api import fetch_stock_data
+from telemetry import span
 
-def generate_chart(symbol):
+CHART_DAYS = 30
+CHART_STYLES = {
+    "price": {"figsize": (10, 5), "dpi": 100},
+    "sparkline": {"figsize": (2.4, 0.6), "dpi": 100},  # Small inline image, line only
+}
+
+class ChartTemplate:
+    """A laid-out figure that is reused across requests; only the line data and titles change.
+
+    Layout (tight_layout, legend, grid, tick styling) is done once when the template
+    is built. Renders of the same template take turns since they share the figure.
+    """
+
+    def __init__(self, style):
+        self.style = style
+        self.lock = threading.Lock()
+        options = CHART_STYLES[style]
+        self.figure = Figure(figsize=options["figsize"], dpi=options["dpi"])
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+
+        # Placeholder series so the date axis, ticks and layout are set up once
+        placeholder_dates = np.arange(np.datetime64("2000-01-01"), np.datetime64("2000-01-31"))
+        placeholder_closes = np.linspace(1000.0, 100000.0, len(placeholder_dates))  # Wide tick labels reserve margin
+        if style == "sparkline":
+            (self.line,) = self.axes.plot(placeholder_dates, placeholder_closes, linestyle='-', color='blue', linewidth=1)
+            self.axes.set_axis_off()
+            self.figure.subplots_adjust(left=0.02, right=0.98, bottom=0.05, top=0.95)
+            self.legend = None
+        else:
+            (self.line,) = self.axes.plot(placeholder_dates, placeholder_closes, marker='o', linestyle='-', color='blue', label="Price")
+            self.axes.set_title("Price Chart (Last 30 Days)")
+            self.axes.set_xlabel("Date")
+            self.axes.set_ylabel("Price (USD)")
+            self.axes.xaxis.set_major_formatter(DateFormatter("%b %d"))
+            self.axes.tick_params(axis="x", labelrotation=45)
+            self.axes.grid(True)
+            self.legend = self.axes.legend(loc="upper left")
+            self.figure.tight_layout()
+        self.figure.set_layout_engine("none")  # Keep the computed layout for every render
+
+    def render(self, symbol, dates, closes, output):
+        """Draw the series and write a PNG to output (a path or binary file object)"""
+        with span("render"), self.lock:
+            self.line.set_data(dates, closes)
+            self.axes.relim()
+            self.axes.autoscale_view()
+            if self.legend is not None:
+                self.axes.set_title(f"{symbol} Price Chart (Last {CHART_DAYS} Days)")
+                self.line.set_label(f"{symbol} Price")
+                self.legend.get_texts()[0].set_text(f"{symbol} Price")
+            self.figure.savefig(output, format="png")
+        return output
+
+_TEMPLATES = {}
+_TEMPLATES_LOCK = threading.Lock()
+
+def get_template(style):
+    with _TEMPLATES_LOCK:
+        if style not in _TEMPLATES:
+            _TEMPLATES[style] = ChartTemplate(style)
+        return _TEMPLATES[style]
+
+def generate_chart(symbol, style="price"):
+    """PNG chart of the last CHART_DAYS closes as a BytesIO ready to send, or None"""
     data = fetch_stock_data(symbol)
-    if not data:
+    if not data or isinstance(data, str):
         return None
 
-    # Extract closing prices
-    try:
-        if symbol.upper() in ["USDT", "BTC", "ETH"]:
-            df = pd.DataFrame.from_dict(data, orient="index")["4a. close (USD)"].astype(float)
-        else:
-            df = pd.DataFrame.from_dict(data, orient="index")["4. close"].astype(float)
-    except KeyError:
-        return None  # If structure is unexpected
-
-    # Sort and slice the last 30 days
-    df = df.sort_index()[-30:]
-
-    # Ensure output directory exists
-    charts_dir = "charts"
-    os.makedirs(charts_dir, exist_ok=True)
-
-    # Unique chart path to avoid file conflicts
-    timestamp = int(time.time())
-    chart_path = os.path.join(charts_dir, f"{symbol}_{timestamp}.png")
-
-    # Plot
-    plt.figure(figsize=(10, 5))
-    plt.plot(df.index, df.values, marker='o', linestyle='-', color='blue', label=f"{symbol} Price")
-    plt.title(f"{symbol} Price Chart (Last 30 Days)")
-    plt.xlabel("Date")
-    plt.ylabel("Price (USD)")
-    plt.xticks(rotation=45)
-    plt.grid(True)
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(chart_path)
-    plt.close()
-
-    return chart_path
+    # Last 30 days straight from the stored columns (already sorted)
+    dates = data.dates[-CHART_DAYS:]
+    closes = data.closes[-CHART_DAYS:]
+
+    # Rendered in memory: concurrent requests for the same symbol can't collide on a file name
+    buffer = io.BytesIO()
+    get_template(style).render(symbol, dates, closes, buffer)
+    buffer.seek(0)
+    return buffer
+
+def generate_sparkline(symbol):
+    return generate_chart(symbol, style="sparkline")
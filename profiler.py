@@ -0,0 +1,124 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Nothing here is installed while idle: the sampler thread and tracemalloc only
+# exist for the duration of a run, so the live process pays no cost in between.
+MAX_PROFILE_SECONDS = 120
+SAMPLE_INTERVAL = 0.005  # 200 Hz
+TOP_ENTRIES = 25
+
+# Leaf frames of threads parked in a blocking wait: the event loop in select(),
+# idle to_thread workers, the log listener and anything blocked on a lock or queue
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),     # concurrent.futures worker waiting for work
+    ("handlers.py", "dequeue"),   # logging QueueListener
+}
+
+_PROFILE_LOCK = threading.Lock()
+
+class ProfilerBusyError(Exception):
+    """Another profile is already running in this process"""
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _is_idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+def _format_table(title, counter, total):
+    lines = [title, f"{'samples':>8} {'%':>6}  function"]
+    for label, count in counter.most_common(TOP_ENTRIES):
+        lines.append(f"{count:>8} {100 * count / total:>5.1f}%  {label}")
+    return "\n".join(lines)
+
+def sample_cpu(seconds, interval=SAMPLE_INTERVAL):
+    """Sample every thread's stack for the given time and return a text report of hot functions.
+
+    Samples whose leaf frame is a blocking wait (see IDLE_FRAMES) are counted as idle and
+    left out of the function tables, so they show what busy threads were doing.
+    """
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        raise ProfilerBusyError("A profile is already running.")
+    try:
+        seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+        own_thread = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        self_counts = Counter()
+        total_counts = Counter()
+        thread_counts = Counter()
+        idle_counts = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                thread_name = thread_names.get(thread_id, str(thread_id))
+                if _is_idle(frame):
+                    idle_counts[thread_name] += 1
+                    continue
+                samples += 1
+                thread_counts[thread_name] += 1
+                self_counts[_frame_label(frame)] += 1
+                seen = set()  # Count recursive functions once per sample
+                while frame is not None:
+                    label = _frame_label(frame)
+                    if label not in seen:
+                        seen.add(label)
+                        total_counts[label] += 1
+                    frame = frame.f_back
+            time.sleep(interval)
+    finally:
+        _PROFILE_LOCK.release()
+
+    idle = sum(idle_counts.values())
+    if not samples:
+        return f"No busy samples collected ({idle} idle)."
+    return "\n\n".join([
+        f"CPU profile: {seconds}s, {samples} busy stack samples every {interval * 1000:.0f} ms ({idle} idle skipped)",
+        _format_table("Busy samples per thread", thread_counts, samples),
+        _format_table("Idle samples per thread", idle_counts, idle) if idle else "No idle samples",
+        _format_table("Top functions (self)", self_counts, samples),
+        _format_table("Top functions (inclusive)", total_counts, samples),
+    ])
+
+def trace_allocations(seconds, frames=10):
+    """Trace allocations for the given time and return a text report of the top allocation sites"""
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        raise ProfilerBusyError("A profile is already running.")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+        if started_here:
+            tracemalloc.start(frames)
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _PROFILE_LOCK.release()
+
+    exclude = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    after = after.filter_traces(exclude)
+    growth = after.compare_to(before.filter_traces(exclude), "lineno")
+    lines = [
+        f"Allocation profile: {seconds}s, traced now {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB",
+        "",
+        "Top growth during the window",
+    ]
+    lines += [str(stat) for stat in growth[:TOP_ENTRIES]]
+    lines += ["", "Top allocation sites still alive (allocated during the window)"]
+    lines += [str(stat) for stat in after.statistics("lineno")[:TOP_ENTRIES]]
+    return "\n".join(lines)
@@ -0,0 +1,67 @@
+import threading
+from stock_api import fetch_stock_data, get_data_version, is_cached, moving_average
+from history_store import load_history
+
+ERROR_REPLY = "Invalid symbol or API error."
+
+REPLY_CACHE = {}  # Format: {(command, symbol): (data_version, text)}
+_SYMBOL_LOCKS = {}  # Format: {symbol: Lock}, kept only for symbols that resolved
+_SYMBOL_LOCKS_LOCK = threading.Lock()
+
+def _format_price(symbol, history):
+    if not len(history.closes):
+        return None
+    return f"Current price of {symbol}: ${float(history.closes[-1]):.2f}"
+
+def _format_ma(symbol, history):
+    ma7 = moving_average(history.closes, 7)
+    ma14 = moving_average(history.closes, 14)
+    if ma14 is None:
+        return None
+    return f"{symbol} Moving Averages:\n7-day: ${ma7:.2f}\n14-day: ${ma14:.2f}"
+
+FORMATTERS = {
+    "price": _format_price,
+    "ma": _format_ma,
+}
+
+def _symbol_lock(symbol):
+    with _SYMBOL_LOCKS_LOCK:
+        if symbol not in _SYMBOL_LOCKS:
+            _SYMBOL_LOCKS[symbol] = threading.Lock()
+        return _SYMBOL_LOCKS[symbol]
+
+def _discard_symbol_lock(symbol, lock):
+    # Requests already waiting still share the old lock; new ones start a fresh one
+    with _SYMBOL_LOCKS_LOCK:
+        if _SYMBOL_LOCKS.get(symbol) is lock:
+            del _SYMBOL_LOCKS[symbol]
+
+def get_reply(command, symbol):
+    """Final reply text for a price or MA request, shared by every chat asking about symbol.
+
+    Replies are reused until fetch_stock_data replaces the series. Concurrent
+    requests for a symbol wait on one lock, so a burst costs one fetch and one render.
+    Rate limit and error replies are not cached.
+    """
+    key = (command, symbol)
+    lock = _symbol_lock(symbol)
+    with lock:
+        if is_cached(symbol):
+            cached = REPLY_CACHE.get(key)
+            if cached and cached[0] == get_data_version(symbol):
+                return cached[1]
+
+        data = fetch_stock_data(symbol)
+        if isinstance(data, str) or not data:
+            # Unknown symbols and failed fetches don't keep a lock around
+            _discard_symbol_lock(symbol, lock)
+            return data if isinstance(data, str) else ERROR_REPLY
+        # Read the version before the data so a concurrent refresh can only make the entry older
+        version = get_data_version(symbol)
+        history = load_history(symbol) or data
+        text = FORMATTERS[command](symbol, history)
+        if text is None:
+            return ERROR_REPLY
+        REPLY_CACHE[key] = (version, text)
+        return text
@@ -0,0 +1,75 @@
+import logging
+import os
+import pickle
+import time
+import zlib
+from config import SNAPSHOT_PATH, SNAPSHOT_MAX_AGE
+import stock_api
+from alerts import ALERTS
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+def save_snapshot(application, paused_chats, path=SNAPSHOT_PATH):
+    """Write refresh timestamps, limiter state, alerts and conversation data to one compressed file.
+
+    Call after the application has stopped and drained, so nothing changes underneath.
+    Bars are not included; they already live in the history store.
+    """
+    state = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "cache": dict(stock_api.CACHE),
+        "upstream": stock_api.UPSTREAM_POOL.export_state(),
+        "alerts": {chat_id: dict(alerts) for chat_id, alerts in ALERTS.items()},
+        "paused_chats": set(paused_chats),
+        "user_data": {user_id: dict(data) for user_id, data in application.user_data.items() if data},
+        "chat_data": {chat_id: dict(data) for chat_id, data in application.chat_data.items() if data},
+    }
+    payload = zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    logger.info(
+        "Saved snapshot to %s (%s bytes, %s users, %s alerts)",
+        path, len(payload), len(state["user_data"]), sum(len(a) for a in ALERTS.values())
+    )
+
+def restore_snapshot(application, paused_chats, path=SNAPSHOT_PATH):
+    """Load a snapshot written by save_snapshot and move it aside to path.restored.
+
+    Returns False if there is none or it is unusable.
+    """
+    try:
+        with open(path, "rb") as f:
+            state = pickle.loads(zlib.decompress(f.read()))
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.error("Ignoring unreadable snapshot %s: %s", path, e)
+        return False
+    if state.get("version") != SNAPSHOT_VERSION:
+        logger.warning("Ignoring snapshot %s with version %s", path, state.get("version"))
+        return False
+    age = time.time() - state["saved_at"]
+    if age > SNAPSHOT_MAX_AGE:
+        logger.warning("Ignoring snapshot %s saved %.0f seconds ago", path, age)
+        return False
+    # Consume it first: if this process crashes, post_stop never writes a new snapshot,
+    # and the next start must not bring back alerts that have fired since
+    os.replace(path, f"{path}.restored")
+
+    stock_api.CACHE.update(state["cache"])
+    stock_api.UPSTREAM_POOL.restore_state(state["upstream"])
+    for chat_id, alerts in state["alerts"].items():
+        ALERTS.setdefault(chat_id, {}).update(alerts)
+    paused_chats.update(state["paused_chats"])
+    # user_data and chat_data are defaultdicts behind read-only proxies, so indexing creates the entry
+    for user_id, data in state["user_data"].items():
+        application.user_data[user_id].update(data)
+    for chat_id, data in state["chat_data"].items():
+        application.chat_data[chat_id].update(data)
+    logger.info("Restored snapshot from %s saved %.0f seconds ago", path, age)
+    return True
@@ -0,0 +1,125 @@
+import atexit
+import contextlib
+import contextvars
+import logging
+import logging.handlers
+import queue
+import random
+import time
+from telegram.request import HTTPXRequest
+from config import LOG_LEVEL, TRACE_SAMPLE_RATE
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+logger = logging.getLogger(__name__)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting them first.
+
+    The stock QueueHandler formats in the caller so records can be pickled; we
+    stay in-process, so message interpolation and I/O both happen off the event loop.
+    """
+
+    def prepare(self, record):
+        return record
+
+_listener = None
+
+def setup_logging(level=LOG_LEVEL):
+    """Route all logging through a queue drained by a background thread"""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Flushes whatever is still queued
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    # Third-party request logs would otherwise dominate the queue at DEBUG
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("matplotlib").setLevel(logging.WARNING)
+
+# Tracing: a TRACE_SAMPLE_RATE fraction of updates (0.05 = one in twenty) carries a
+# Trace in a context variable. span() is a no-op for the rest, costing a single ContextVar lookup.
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.spans = {}  # Format: {span_name: [total_seconds, count]}
+
+    def add(self, name, seconds):
+        entry = self.spans.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def __str__(self):
+        # Called by the log listener thread, not by the traced code
+        return " ".join(
+            f"{name}={total * 1000:.1f}ms" + (f"x{count}" if count > 1 else "")
+            for name, (total, count) in self.spans.items()
+        )
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name):
+    """Time a block under the current trace; free when the update isn't sampled"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+@contextlib.contextmanager
+def trace_update(update_id, sample_rate=None):
+    """Start a sampled trace for one update; the root span is "handler" """
+    sample_rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        yield None
+        return
+    trace = Trace(update_id)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.add("handler", time.perf_counter() - start)
+        _current_trace.reset(token)
+        logger.info("trace update=%s %s", update_id, trace)
+
+class TracedHTTPXRequest(HTTPXRequest):
+    """Bot API transport that records outbound calls as "send" spans"""
+
+    async def do_request(self, *args, **kwargs):
+        with span("send"):
+            return await super().do_request(*args, **kwargs)
@@ -0,0 +1,4 @@
+import os
+
+# stock_api builds its key pool on import; tests never reach a real provider
+os.environ.setdefault("UPSTREAM_KEYS", "static:test")
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import alerts
+from alerts import MAX_POLL_INTERVAL, PLAN_HORIZON, crossing_probability, plan_alert_polling, take_due_symbols
+from config import ALERT_CHECK_INTERVAL
+
+@pytest.fixture(autouse=True)
+def planner(monkeypatch):
+    """Fresh alert state, stored prices from PRICES and a fixed remaining quota"""
+    prices = {}
+    monkeypatch.setattr(alerts, "ALERTS", {})
+    monkeypatch.setattr(alerts, "POLL_PLAN", {})
+    monkeypatch.setattr(alerts, "LAST_POLLED", {})
+    monkeypatch.setattr(alerts, "PLANNER_METRICS", {})
+    monkeypatch.setattr(alerts, "ALERT_DAILY_BUDGET", 15)
+    monkeypatch.setattr(alerts, "get_remaining_daily_requests", lambda: 500)
+    monkeypatch.setattr(
+        alerts, "get_cached_closes",
+        lambda symbol, count: np.full(count, prices[symbol]) if symbol in prices else np.empty(0)
+    )
+    return prices
+
+def planned_requests(plan):
+    return sum(PLAN_HORIZON / interval for interval in plan.values())
+
+def test_crossing_probability():
+    assert crossing_probability(110.0, 100.0, 0.02, 1) == 1.0
+    assert crossing_probability(None, 100.0, 0.02, 1) == 0.0
+    near = crossing_probability(99.0, 100.0, 0.02, 1)
+    far = crossing_probability(80.0, 100.0, 0.02, 1)
+    assert 0.0 < far < near < 1.0
+
+def test_plan_stays_within_budget(planner):
+    for index, symbol in enumerate(["AAA", "BBB", "CCC", "DDD"]):
+        planner[symbol] = 100.0
+        alerts.add_alert(1, symbol, [100.5, 101.0, 102.0, 103.0][index])
+    plan = plan_alert_polling()
+    assert set(plan) == {"AAA", "BBB", "CCC", "DDD"}
+    assert planned_requests(plan) <= 15 + 1e-6
+    # Closer to its threshold means polled more often
+    assert plan["AAA"] < plan["BBB"] < plan["DDD"]
+
+def test_intervals_are_clamped_to_the_alert_interval(planner):
+    planner["NEAR"] = 100.0
+    planner["OTHER"] = 100.0
+    alerts.add_alert(1, "NEAR", 100.1, interval=7200)
+    alerts.add_alert(1, "OTHER", 110.0)
+    plan = plan_alert_polling()
+    assert plan["NEAR"] == 7200  # Would be polled far more often without the per-alert bound
+    assert planned_requests(plan) == pytest.approx(15)  # The rest of the budget goes to OTHER
+
+def test_far_symbols_are_capped_at_max_interval(planner, monkeypatch):
+    monkeypatch.setattr(alerts, "ALERT_DAILY_BUDGET", 3)
+    planner["NEAR"] = 100.0
+    planner["FAR"] = 1.0
+    alerts.add_alert(1, "NEAR", 100.1)
+    alerts.add_alert(1, "FAR", 1000.0)
+    plan = plan_alert_polling()
+    assert plan["FAR"] == MAX_POLL_INTERVAL
+    assert planned_requests(plan) <= 3 + 1e-6
+
+def test_intervals_never_go_below_the_check_interval(planner, monkeypatch):
+    monkeypatch.setattr(alerts, "ALERT_DAILY_BUDGET", 100000)
+    monkeypatch.setattr(alerts, "get_remaining_daily_requests", lambda: 100000)
+    planner["AAA"] = 100.0
+    alerts.add_alert(1, "AAA", 100.1, interval=1)
+    assert plan_alert_polling()["AAA"] == ALERT_CHECK_INTERVAL
+
+def test_paused_chats_get_no_budget(planner):
+    planner["AAA"] = 100.0
+    planner["BBB"] = 100.0
+    alerts.add_alert(1, "AAA", 101.0)
+    alerts.add_alert(2, "BBB", 101.0)
+    assert set(plan_alert_polling(paused_chats={2})) == {"AAA"}
+
+def test_failed_symbol_is_not_repolled_before_its_interval(planner):
+    alerts.add_alert(1, "BAD", 100.0)  # Nothing stored, as after failed fetches
+    interval = plan_alert_polling()["BAD"]
+    assert take_due_symbols(now=1000) == ["BAD"]
+    assert take_due_symbols(now=1000 + ALERT_CHECK_INTERVAL) == []
+    assert take_due_symbols(now=1000 + interval / 2) == []
+    assert take_due_symbols(now=1000 + interval) == ["BAD"]
+
+def test_paused_chats_are_not_polled(planner):
+    alerts.add_alert(1, "AAA", 100.0)
+    alerts.add_alert(2, "BBB", 100.0)
+    assert take_due_symbols(paused_chats={2}, now=1000) == ["AAA"]
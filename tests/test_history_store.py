@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import history_store
+from history_store import load_history, merge_bars
+
+@pytest.fixture(autouse=True)
+def history_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_store, "HISTORY_DIR", str(tmp_path))
+
+def stored(symbol):
+    history = load_history(symbol)
+    return {str(day): float(close) for day, close in zip(history.dates, history.closes)}
+
+def test_first_merge_stores_bars_oldest_first():
+    merge_bars("AAPL", {"2024-10-16": 2.0, "2024-10-15": 1.0})
+    history = load_history("AAPL")
+    assert history.dates.tolist() == np.array(["2024-10-15", "2024-10-16"], dtype="datetime64[D]").tolist()
+    assert history.closes.tolist() == [1.0, 2.0]
+
+def test_overlapping_bars_are_replaced_and_new_ones_appended():
+    merge_bars("AAPL", {"2024-10-14": 1.0, "2024-10-15": 2.0})
+    merge_bars("AAPL", {"2024-10-15": 2.5, "2024-10-16": 3.0})
+    assert stored("AAPL") == {"2024-10-14": 1.0, "2024-10-15": 2.5, "2024-10-16": 3.0}
+
+def test_lagging_window_keeps_newer_stored_bars():
+    # e.g. failover to a provider that hasn't published today's bar yet
+    merge_bars("AAPL", {"2024-10-15": 1.0, "2024-10-16": 2.0, "2024-10-17": 3.0})
+    history = merge_bars("AAPL", {"2024-10-15": 1.5, "2024-10-16": 2.0})
+    assert stored("AAPL") == {"2024-10-15": 1.5, "2024-10-16": 2.0, "2024-10-17": 3.0}
+    assert float(history.closes[-1]) == 3.0
+
+def test_window_with_a_gap_fills_in_between():
+    merge_bars("AAPL", {"2024-10-14": 1.0, "2024-10-17": 4.0})
+    merge_bars("AAPL", {"2024-10-15": 2.0, "2024-10-16": 3.0})
+    assert list(stored("AAPL").values()) == [1.0, 2.0, 3.0, 4.0]
+
+def test_unknown_symbol_has_no_history():
+    assert load_history("NOPE") is None
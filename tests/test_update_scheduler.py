@@ -0,0 +1,98 @@
+import asyncio
+from update_scheduler import ChatUpdateScheduler
+
+TIMEOUT = 5  # Only reached when a test would otherwise hang
+
+def make_job(log, name, gate=None, seconds=0):
+    async def job():
+        log.append(("start", name))
+        if gate is not None:
+            await gate.wait()
+        await asyncio.sleep(seconds)
+        log.append(("end", name))
+    return job
+
+async def settle():
+    # Let workers pick up whatever is runnable
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+def test_jobs_of_one_chat_run_in_order_one_at_a_time():
+    async def scenario():
+        scheduler = ChatUpdateScheduler(max_workers=4)
+        log = []
+        for index in range(5):
+            # Later jobs are quicker, so any overlap would reorder the log
+            await scheduler.submit("a", make_job(log, index, seconds=0.01 * (5 - index)))
+        await scheduler.shutdown()
+        return log
+
+    log = asyncio.run(scenario())
+    expected = []
+    for index in range(5):
+        expected += [("start", index), ("end", index)]
+    assert log == expected
+
+def test_other_chats_are_not_held_behind_a_slow_chat():
+    async def scenario():
+        scheduler = ChatUpdateScheduler(max_workers=4)
+        log = []
+        gate = asyncio.Event()
+        await scheduler.submit("slow", make_job(log, "slow", gate))
+        await scheduler.submit("fast", make_job(log, "fast"))
+        await asyncio.wait_for(scheduler.submit("fast", make_job(log, "fast again")), TIMEOUT)
+        await settle()
+        snapshot = list(log)
+        gate.set()
+        await scheduler.shutdown()
+        return snapshot
+
+    snapshot = asyncio.run(scenario())
+    assert ("end", "fast again") in snapshot
+    assert ("end", "slow") not in snapshot
+
+def test_full_chat_is_rejected_without_blocking_other_chats():
+    async def scenario():
+        scheduler = ChatUpdateScheduler(max_workers=4, max_pending=100, max_pending_per_chat=4)
+        log = []
+        gate = asyncio.Event()
+        await scheduler.submit(0, make_job(log, ("flood", 0), gate))
+        await settle()  # Flood 0 is now running; the limit applies to jobs still queued behind it
+        accepted = [
+            await asyncio.wait_for(scheduler.submit(0, make_job(log, ("flood", index), gate)), TIMEOUT)
+            for index in range(1, 7)
+        ]
+        # The flood is still blocked on the gate, so this only returns if submit doesn't wait on chat 0
+        other_accepted = await asyncio.wait_for(scheduler.submit(1, make_job(log, "other")), TIMEOUT)
+        await settle()
+        snapshot = list(log)
+        gate.set()
+        await scheduler.shutdown()
+        return accepted, other_accepted, snapshot, log
+
+    accepted, other_accepted, snapshot, log = asyncio.run(scenario())
+    assert accepted == [True] * 4 + [False] * 2
+    assert other_accepted
+    assert ("end", "other") in snapshot
+    assert [entry for entry in log if entry[0] == "end" and entry[1] != "other"] == [
+        ("end", ("flood", index)) for index in range(5)
+    ]
+
+def test_submit_waits_while_the_global_backlog_is_full():
+    async def scenario():
+        scheduler = ChatUpdateScheduler(max_workers=1, max_pending=2, max_pending_per_chat=10)
+        log = []
+        gate = asyncio.Event()
+        await scheduler.submit("a", make_job(log, "a", gate))
+        await scheduler.submit("b", make_job(log, "b"))
+        blocked = asyncio.create_task(scheduler.submit("c", make_job(log, "c")))
+        await settle()
+        waited = not blocked.done()
+        gate.set()
+        await asyncio.wait_for(blocked, TIMEOUT)
+        await scheduler.shutdown()
+        return waited, log
+
+    waited, log = asyncio.run(scenario())
+    assert waited
+    assert [entry for entry in log if entry[0] == "end"] == [("end", "a"), ("end", "b"), ("end", "c")]
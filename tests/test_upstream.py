@@ -0,0 +1,70 @@
+import pytest
+from upstream import (
+    DAILY_LIMIT_MESSAGE, RateLimitError, StaticProvider, UpstreamError, UpstreamKey, UpstreamPool,
+    parse_upstream_keys,
+)
+
+SERIES = {"AAPL": {"2024-01-02": {"4. close": "185.64"}}}
+
+def make_key(name, provider=None):
+    return UpstreamKey(provider or StaticProvider(SERIES), name, label=name)
+
+def test_rate_limited_key_fails_over_and_cools_down():
+    limited = make_key("limited", StaticProvider(error=RateLimitError("quota", retry_after=120)))
+    healthy = make_key("healthy")
+    # The healthy key starts busier, so the limited one is tried first
+    healthy.record_request(0)
+    pool = UpstreamPool([limited, healthy])
+
+    assert pool.fetch("AAPL") == SERIES["AAPL"]
+    assert limited.provider.calls == 1
+    assert healthy.provider.calls == 1
+    assert limited.cooldown_until > healthy.cooldown_until
+
+    pool.fetch("AAPL")
+    assert limited.provider.calls == 1
+
+def test_failing_key_fails_over_and_backs_off():
+    failing = make_key("failing", StaticProvider(error=UpstreamError("HTTP 502")))
+    healthy = make_key("healthy")
+    healthy.record_request(0)
+    pool = UpstreamPool([failing, healthy])
+
+    assert pool.fetch("AAPL") == SERIES["AAPL"]
+    assert failing.failures == 1
+    assert failing.cooldown_until > 0
+    assert healthy.failures == 0
+
+def test_requests_go_to_the_least_loaded_key():
+    keys = [make_key(name) for name in ("a", "b", "c")]
+    pool = UpstreamPool(keys)
+    for _ in range(6):
+        pool.fetch("AAPL")
+    assert [key.provider.calls for key in keys] == [2, 2, 2]
+
+def test_unknown_symbol_returns_none_without_failover():
+    keys = [make_key("a"), make_key("b")]
+    pool = UpstreamPool(keys)
+    assert pool.fetch("NOPE") is None
+    assert sum(key.provider.calls for key in keys) == 1
+
+def test_daily_limit_message_once_every_key_is_spent():
+    provider = StaticProvider(SERIES)
+    provider.daily_request_limit = 2
+    keys = [make_key("a", provider), make_key("b", provider)]
+    pool = UpstreamPool(keys)
+    for _ in range(4):
+        assert pool.fetch("AAPL") == SERIES["AAPL"]
+    assert pool.fetch("AAPL") == DAILY_LIMIT_MESSAGE
+    assert provider.calls == 4
+    assert pool.remaining_daily_requests() == 0
+
+def test_pool_without_keys_is_rejected():
+    with pytest.raises(ValueError):
+        UpstreamPool([])
+
+def test_parse_upstream_keys():
+    keys = parse_upstream_keys(["KEY1", " static:KEY2 ", ""])
+    assert [(key.provider.name, key.api_key) for key in keys] == [("alphavantage", "KEY1"), ("static", "KEY2")]
+    with pytest.raises(ValueError):
+        parse_upstream_keys(["nope:KEY"])
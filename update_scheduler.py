@@ -0,0 +1,123 @@
+import asyncio
+import functools
+import logging
+from collections import deque
+from telegram import Update
+from telegram.ext import Application
+from config import UPDATE_WORKERS, UPDATE_QUEUE_LIMIT, UPDATE_CHAT_QUEUE_LIMIT
+from telemetry import trace_update
+
+logger = logging.getLogger(__name__)
+
+BUSY_REPLY = "Still working on your earlier requests. Please try again in a moment."
+
+class ChatUpdateScheduler:
+    """Runs jobs for different chats concurrently while keeping each chat's jobs in arrival order.
+
+    Every chat gets its own FIFO; a chat is handed to at most one worker at a time,
+    so the button -> handle_text flow in user_data sees its updates in order.
+    submit() blocks while the global backlog is full. A chat over its own limit
+    gets its job rejected instead, so one flooding chat can't stall intake for the rest.
+    """
+
+    def __init__(self, max_workers=UPDATE_WORKERS, max_pending=UPDATE_QUEUE_LIMIT,
+                 max_pending_per_chat=UPDATE_CHAT_QUEUE_LIMIT):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_pending_per_chat = max_pending_per_chat
+        self.pending = 0
+        self._queues = {}  # Format: {chat_key: deque of jobs}, present while the chat has work
+        self._ready = None  # Chat keys waiting for a worker
+        self._space = None
+        self._workers = []
+
+    def _start(self):
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+
+    async def submit(self, chat_key, job):
+        """Queue a zero-argument coroutine function behind earlier jobs of the same chat.
+
+        Returns False without queueing when the chat already has max_pending_per_chat jobs.
+        """
+        if not self._workers:
+            self._start()
+        async with self._space:
+            await self._space.wait_for(lambda: self.pending < self.max_pending)
+            queue = self._queues.get(chat_key)
+            if queue is None:
+                self._queues[chat_key] = deque([job])
+                self._ready.put_nowait(chat_key)
+            elif len(queue) >= self.max_pending_per_chat:
+                return False
+            else:
+                queue.append(job)
+            self.pending += 1
+            return True
+
+    async def _worker(self):
+        while True:
+            chat_key = await self._ready.get()
+            queue = self._queues[chat_key]
+            job = queue.popleft()
+            try:
+                await job()
+            except Exception as e:
+                logger.error("Unhandled error while processing update for chat %s: %s", chat_key, e)
+            async with self._space:
+                self.pending -= 1
+                if queue:
+                    # Requeue behind other chats so a busy chat can't starve the rest
+                    self._ready.put_nowait(chat_key)
+                else:
+                    del self._queues[chat_key]
+                self._space.notify_all()
+
+    async def drain(self):
+        """Wait until every submitted job has finished"""
+        if not self._workers:
+            return
+        async with self._space:
+            await self._space.wait_for(lambda: self.pending == 0)
+
+    async def shutdown(self):
+        await self.drain()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+def get_chat_key(update):
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return ("user", update.effective_user.id)
+    return ("update", update.update_id)
+
+class ScheduledApplication(Application):
+    """Application that hands updates to a ChatUpdateScheduler instead of processing them one by one"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.update_scheduler = ChatUpdateScheduler()
+
+    async def process_update(self, update):
+        if not isinstance(update, Update):
+            await super().process_update(update)
+            return
+        # Returns once the update is queued, so a full global backlog holds back the update fetcher;
+        # with a bounded update_queue that in turn makes polling and the webhook handler wait
+        chat_key = get_chat_key(update)
+        if not await self.update_scheduler.submit(chat_key, functools.partial(self._process_traced, update)):
+            logger.warning("Dropping update %s: chat %s has too many pending updates", update.update_id, chat_key)
+            if update.effective_message:
+                self.create_task(update.effective_message.reply_text(BUSY_REPLY))
+
+    async def _process_traced(self, update):
+        with trace_update(update.update_id):
+            await Application.process_update(self, update)
+
+    async def stop(self):
+        await super().stop()
+        await self.update_scheduler.shutdown()
@@ -0,0 +1,291 @@
+import hashlib
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+import requests
+from telemetry import span
+
+logger = logging.getLogger(__name__)
+
+DAILY_LIMIT_MESSAGE = "Daily API limit exceeded. Please try again tomorrow."
+BUSY_MESSAGE = "All data providers are busy. Please try again in a few minutes."
+MAX_WAIT = 60           # Longest we block for a key to free up before giving up
+MAX_ERROR_COOLDOWN = 300
+
+class UpstreamError(Exception):
+    """Request failed for reasons unrelated to the symbol (network, HTTP, bad payload)"""
+
+class RateLimitError(UpstreamError):
+    def __init__(self, message, retry_after=60):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def is_crypto(symbol):
+    return symbol.upper() in ["USDT", "BTC", "ETH"]
+
+class Provider(ABC):
+    """Source of daily bars in Alpha Vantage's layout: {"YYYY-MM-DD": {"4. close": "..."}}.
+
+    Crypto series use "4a. close (USD)" for the close, as Alpha Vantage does.
+    compact=True asks for recent bars only, for merging into stored history.
+    fetch_daily returns None for unknown symbols and raises UpstreamError otherwise.
+    """
+
+    name = "provider"
+    requests_per_minute = 5
+    daily_request_limit = 25
+
+    @abstractmethod
+    def fetch_daily(self, symbol, api_key, compact=False):
+        raise NotImplementedError
+
+class AlphaVantageProvider(Provider):
+    name = "alphavantage"
+    requests_per_minute = 5
+    daily_request_limit = 25  # Free account
+
+    def fetch_daily(self, symbol, api_key, compact=False):
+        if is_crypto(symbol):
+            # The digital currency endpoint has no compact mode
+            url = f"https://www.alphavantage.co/query?function=DIGITAL_CURRENCY_DAILY&symbol={symbol.upper()}&market=USD&apikey={api_key}"
+            series_key = "Time Series (Digital Currency Daily)"
+        else:
+            # Always compact (last 100 bars): full output is a premium feature, history builds up in the store
+            url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={symbol.upper()}&outputsize=compact&apikey={api_key}"
+            series_key = "Time Series (Daily)"
+        try:
+            response = requests.get(url, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise UpstreamError(str(e))
+        logger.debug("Alpha Vantage response status for %s: %s", symbol, response.status_code)
+
+        # Throttled calls come back as HTTP 200 with a "Note" or "Information" field
+        notice = data.get("Note") or data.get("Information")
+        if notice:
+            retry_after = 86400 if "per day" in notice else 60
+            raise RateLimitError(notice, retry_after)
+        if series_key not in data:
+            logger.error("Failed to fetch data for %s: %s", symbol, data)
+            return None
+        return data[series_key]
+
+class FmpProvider(Provider):
+    """Financial Modeling Prep, converted to Alpha Vantage's layout"""
+
+    name = "fmp"
+    requests_per_minute = 60
+    daily_request_limit = 250  # Free account
+
+    def fetch_daily(self, symbol, api_key, compact=False):
+        ticker = f"{symbol.upper()}USD" if is_crypto(symbol) else symbol.upper()
+        window = "timeseries=10&" if compact else ""
+        url = f"https://financialmodelingprep.com/api/v3/historical-price-full/{ticker}?{window}apikey={api_key}"
+        try:
+            response = requests.get(url, timeout=10)
+            if response.status_code == 429:
+                raise RateLimitError("FMP rate limit reached")
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise UpstreamError(str(e))
+
+        if isinstance(data, dict) and "Error Message" in data:
+            if "limit" in data["Error Message"].lower():
+                raise RateLimitError(data["Error Message"], 86400)
+            raise UpstreamError(data["Error Message"])
+        if not isinstance(data, dict) or not data.get("historical"):
+            logger.error("Failed to fetch data for %s: %s", symbol, data)
+            return None
+        close_key = "4a. close (USD)" if is_crypto(symbol) else "4. close"
+        return {bar["date"]: {close_key: str(bar["close"])} for bar in data["historical"]}
+
+class StaticProvider(Provider):
+    """In-process stand-in that serves canned series, for tests and local runs"""
+
+    name = "static"
+    requests_per_minute = 1000
+    daily_request_limit = 100000
+
+    def __init__(self, series=None, error=None):
+        self.series = series or {}  # Format: {symbol: time_series}
+        self.error = error  # Raised on every call when set, e.g. RateLimitError("quota")
+        self.calls = 0
+
+    def fetch_daily(self, symbol, api_key, compact=False):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.series.get(symbol.upper())
+
+PROVIDERS = {
+    AlphaVantageProvider.name: AlphaVantageProvider,
+    FmpProvider.name: FmpProvider,
+    StaticProvider.name: StaticProvider,
+}
+
+class UpstreamKey:
+    """One credential with its own quota windows and health state"""
+
+    def __init__(self, provider, api_key, label=None):
+        self.provider = provider
+        self.api_key = api_key
+        self.label = label or f"{provider.name}:{api_key[-4:] if api_key else '-'}"
+        self.minute_timestamps = []
+        self.daily_timestamps = []
+        self.cooldown_until = 0
+        self.failures = 0
+
+    @property
+    def key_id(self):
+        """Stable identifier for snapshots that doesn't reveal the key"""
+        digest = hashlib.sha256(self.api_key.encode()).hexdigest()[:16]
+        return f"{self.provider.name}:{digest}"
+
+    def export_state(self):
+        return {
+            "minute_timestamps": list(self.minute_timestamps),
+            "daily_timestamps": list(self.daily_timestamps),
+            "cooldown_until": self.cooldown_until,
+            "failures": self.failures,
+        }
+
+    def restore_state(self, state):
+        self.minute_timestamps = list(state.get("minute_timestamps", []))
+        self.daily_timestamps = list(state.get("daily_timestamps", []))
+        self.cooldown_until = state.get("cooldown_until", 0)
+        self.failures = state.get("failures", 0)
+
+    def _prune(self, now):
+        self.minute_timestamps = [t for t in self.minute_timestamps if now - t < 60]
+        self.daily_timestamps = [t for t in self.daily_timestamps if now - t < 86400]
+
+    def daily_remaining(self, now):
+        self._prune(now)
+        return max(self.provider.daily_request_limit - len(self.daily_timestamps), 0)
+
+    def wait_time(self, now):
+        """Seconds until this key may send a request, None when its daily quota is spent"""
+        if self.daily_remaining(now) == 0:
+            return None
+        wait = max(self.cooldown_until - now, 0)
+        if len(self.minute_timestamps) >= self.provider.requests_per_minute:
+            wait = max(wait, 60 - (now - self.minute_timestamps[0]))
+        return wait
+
+    def load(self, now):
+        self._prune(now)
+        return (
+            len(self.daily_timestamps) / self.provider.daily_request_limit,
+            len(self.minute_timestamps) / self.provider.requests_per_minute,
+        )
+
+    def record_request(self, now):
+        self.minute_timestamps.append(now)
+        self.daily_timestamps.append(now)
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_rate_limit(self, now, retry_after):
+        self.cooldown_until = now + retry_after
+
+    def record_failure(self, now):
+        self.failures += 1
+        self.cooldown_until = now + min(2 ** self.failures, MAX_ERROR_COOLDOWN)
+
+class UpstreamPool:
+    """Routes each fetch to the least-loaded healthy key and fails over on errors"""
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError("No upstream API keys configured. Set ALPHA_VANTAGE_API_KEY, FMP_API_KEY or UPSTREAM_KEYS.")
+        self.keys = keys
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        """Reserve a request on the best key; returns (key, None) or (None, seconds_to_wait)"""
+        with self._lock:
+            now = time.time()
+            waits = [(key.wait_time(now), key) for key in self.keys]
+            ready = [key for wait, key in waits if wait == 0]
+            if ready:
+                key = min(ready, key=lambda k: k.load(now))
+                key.record_request(now)
+                return key, None
+            pending = [wait for wait, _ in waits if wait is not None]
+            return None, (min(pending) if pending else None)
+
+    def export_state(self):
+        with self._lock:
+            return {key.key_id: key.export_state() for key in self.keys}
+
+    def restore_state(self, state):
+        """Reapply quota windows and health saved by export_state; unknown keys are ignored"""
+        with self._lock:
+            for key in self.keys:
+                if key.key_id in state:
+                    key.restore_state(state[key.key_id])
+
+    def remaining_daily_requests(self):
+        with self._lock:
+            now = time.time()
+            return sum(key.daily_remaining(now) for key in self.keys if key.cooldown_until - now < 3600)
+
+    def fetch(self, symbol, max_attempts=3, compact=False):
+        """Daily series for symbol, None for unknown symbols or repeated failures, or a message string"""
+        attempts = 0
+        while attempts < max_attempts:
+            with span("limiter"):
+                key, wait = self._acquire()
+            if key is None:
+                if wait is None:
+                    logger.error("Daily API rate limit exceeded on every key.")
+                    return DAILY_LIMIT_MESSAGE
+                if wait > MAX_WAIT:
+                    logger.warning("No upstream key available for %.0f seconds.", wait)
+                    return BUSY_MESSAGE
+                logger.warning("All upstream keys throttled. Sleeping for %.2f seconds.", wait)
+                with span("limiter"):
+                    time.sleep(wait)
+                continue
+
+            attempts += 1
+            try:
+                with span("fetch"):
+                    data = key.provider.fetch_daily(symbol, key.api_key, compact=compact)
+            except RateLimitError as e:
+                logger.warning("Key %s rate limited for %s: %s", key.label, symbol, e)
+                with self._lock:
+                    key.record_rate_limit(time.time(), e.retry_after)
+                continue
+            except UpstreamError as e:
+                logger.warning("Attempt %s on key %s failed for %s: %s", attempts, key.label, symbol, e)
+                with self._lock:
+                    key.record_failure(time.time())
+                continue
+            with self._lock:
+                key.record_success()
+            return data
+
+        logger.error("All retries failed for %s", symbol)
+        return None
+
+def parse_upstream_keys(entries, default_provider=AlphaVantageProvider.name):
+    """Build keys from "provider:key" entries; bare keys use the default provider"""
+    providers = {}
+    keys = []
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, api_key = entry.rpartition(":")
+        name = name or default_provider
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown upstream provider '{name}'")
+        if name not in providers:
+            providers[name] = PROVIDERS[name]()
+        keys.append(UpstreamKey(providers[name], api_key))
+    return keys